@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+MarketPulse AI serialization micro-benchmark
+Compares, for the list and detail endpoints, the previous response path
+(build models, validate them again through response_model, stdlib JSON)
+with trusted_response (model_construct + orjson), on synthetic documents.
+
+Usage:
+    python benchmarks/serialization.py --docs 100 --iterations 200
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "benchmark")
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from server import AnalysisResponse, ReportResponse, trusted_response
+
+INSIGHTS = "Le marché des PME françaises montre une forte croissance. " * 80
+
+
+def analysis_doc(i):
+    return {
+        "id": str(uuid.uuid4()),
+        "user_id": "benchmark-user",
+        "title": f"Analyse {i}",
+        "industry": "SaaS",
+        "target_market": "PME françaises 10-50 employés",
+        "competitors": ["Competitor1", "Competitor2", "Competitor3"],
+        "description": "Analyse de marché pour un outil de facturation en ligne",
+        "status": "completed",
+        "ai_insights": INSIGHTS,
+        "opportunities": [{
+            "id": str(uuid.uuid4()),
+            "title": "Opportunité marché PME",
+            "description": "Opportunité identifiée par l'analyse IA",
+            "potential_revenue": "50K - 200K €",
+            "risk_level": "medium",
+            "priority": "high"
+        }],
+        "insights_source_id": None,
+        "input_hash": uuid.uuid4().hex,
+        "version": 1,
+        "created_at": "2025-01-08T10:00:00+00:00",
+        "updated_at": "2025-01-08T10:00:00+00:00"
+    }
+
+
+def report_doc(i):
+    return {
+        "id": str(uuid.uuid4()),
+        "user_id": "benchmark-user",
+        "analysis_id": str(uuid.uuid4()),
+        "report_type": "market_overview",
+        "title": f"Aperçu du Marché - Analyse {i}",
+        "content": INSIGHTS * 3,
+        "status": "completed",
+        "analysis_version": 1,
+        "stale": False,
+        "created_at": "2025-01-08T10:00:00+00:00"
+    }
+
+
+async def previous_path(model, field, docs):
+    """What FastAPI did before: handler builds models, response_model validates and encodes them."""
+    if isinstance(docs, list):
+        content = [model(**d) for d in docs]
+    else:
+        content = model(**docs)
+    body = await serialize_response(field=field, response_content=content, is_coroutine=True)
+    return JSONResponse(body).body
+
+
+async def trusted_path(model, docs):
+    return trusted_response(model, docs).body
+
+
+def timed(coro_factory, iterations):
+    loop = asyncio.new_event_loop()
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        loop.run_until_complete(coro_factory())
+        timings.append((time.perf_counter() - start) * 1000)
+    loop.close()
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare response serialization paths")
+    parser.add_argument("--docs", type=int, default=100, help="documents per list response")
+    parser.add_argument("--iterations", type=int, default=200, help="timed runs per endpoint")
+    args = parser.parse_args()
+
+    analyses = [analysis_doc(i) for i in range(args.docs)]
+    reports = [report_doc(i) for i in range(args.docs)]
+    endpoints = [
+        ("GET /api/analyses", AnalysisResponse, List[AnalysisResponse], analyses),
+        ("GET /api/analyses/{id}", AnalysisResponse, AnalysisResponse, analyses[0]),
+        ("GET /api/reports", ReportResponse, List[ReportResponse], reports),
+        ("GET /api/reports/{id}", ReportResponse, ReportResponse, reports[0]),
+    ]
+
+    print(f"📊 Serialization time per request (median of {args.iterations}, {args.docs} docs per list)")
+    print("=" * 72)
+    print(f"{'endpoint':<26} {'before':>12} {'after':>12} {'speedup':>10}")
+    for name, model, response_type, docs in endpoints:
+        # FastAPI builds the response field once, when the route is registered
+        field = create_response_field(name="benchmark", type_=response_type)
+        loop = asyncio.new_event_loop()
+        before_body = loop.run_until_complete(previous_path(model, field, docs))
+        after_body = loop.run_until_complete(trusted_path(model, docs))
+        loop.close()
+        if json.loads(before_body) != json.loads(after_body):
+            sys.exit(f"❌ {name}: fast path output differs from the previous path")
+
+        before = timed(lambda: previous_path(model, field, docs), args.iterations)
+        after = timed(lambda: trusted_path(model, docs), args.iterations)
+        print(f"{name:<26} {before:>9.3f} ms {after:>9.3f} ms {before / after:>9.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
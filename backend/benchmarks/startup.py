@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+MarketPulse AI cold start benchmark
+Measures how long `import server` takes and which modules the time goes to,
+using `python -X importtime` in fresh interpreters.
+
+Usage:
+    python benchmarks/startup.py --runs 5 --top 15 --budget-ms 800
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def import_once(module):
+    """Import `module` in a fresh interpreter and return per-package self times (us) and the total (us)."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        sys.exit(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    per_package = defaultdict(int)
+    total = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        per_package[name.split(".")[0]] += int(self_us)
+        if name == module:
+            total = int(cumulative_us)
+    return per_package, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report import time per module for the API server")
+    parser.add_argument("--module", default="server", help="module to import (default: server)")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters to average over")
+    parser.add_argument("--top", type=int, default=15, help="number of packages to list")
+    parser.add_argument("--budget-ms", type=float, default=None, help="fail if the median total exceeds this")
+    args = parser.parse_args()
+
+    samples = defaultdict(list)
+    totals = []
+    for _ in range(args.runs):
+        per_package, total = import_once(args.module)
+        totals.append(total)
+        for package, self_us in per_package.items():
+            samples[package].append(self_us)
+
+    medians = {package: statistics.median(values) for package, values in samples.items()}
+    total_ms = statistics.median(totals) / 1000
+
+    print(f"📊 import {args.module}: {total_ms:.1f} ms (median of {args.runs} runs)")
+    print("=" * 60)
+    for package, self_us in sorted(medians.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"{package:<40} {self_us / 1000:>8.1f} ms")
+
+    if args.budget_ms is not None:
+        print("=" * 60)
+        if total_ms > args.budget_ms:
+            print(f"❌ Over budget: {total_ms:.1f} ms > {args.budget_ms:.1f} ms")
+            return 1
+        print(f"✅ Within budget: {total_ms:.1f} ms <= {args.budget_ms:.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,25 +1,39 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, Request
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Query, status, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import Response
+from fastapi.responses import Response, ORJSONResponse
+from fastapi.routing import APIRoute
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from starlette.datastructures import MutableHeaders
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReplaceOne, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from bson import Binary
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, EmailStr
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Literal
+from collections import OrderedDict
 import uuid
 from datetime import datetime, timezone, timedelta
 import jwt
 import bcrypt
-from emergentintegrations.llm.chat import LlmChat, UserMessage
-from emergentintegrations.payments.stripe.checkout import StripeCheckout, CheckoutSessionResponse, CheckoutStatusResponse, CheckoutSessionRequest
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-from reportlab.lib.units import inch
-from io import BytesIO
+import re
+import json
+import hashlib
+import zlib
+import asyncio
+import sys
+import time
+import random
+import threading
+import functools
+import heapq
+import itertools
+import math
+from contextlib import contextmanager, asynccontextmanager, nullcontext
+from contextvars import ContextVar
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -37,18 +51,249 @@ ACCESS_TOKEN_EXPIRE_HOURS = 24
 # LLM Config
 EMERGENT_LLM_KEY = os.environ.get('EMERGENT_LLM_KEY')
 
+# Startup Config
+MONGO_WARM_CONNECTIONS = int(os.environ.get('MONGO_WARM_CONNECTIONS', '4'))
+PRELOAD_LLM = os.environ.get('PRELOAD_LLM', 'false').lower() == 'true'
+
 # Stripe Config
 STRIPE_API_KEY = os.environ.get('STRIPE_API_KEY')
 
+# Similarity Config
+SIMILARITY_THRESHOLD = float(os.environ.get('SIMILARITY_THRESHOLD', '0.9'))
+SIMILARITY_CACHE_SIZE = int(os.environ.get('SIMILARITY_CACHE_SIZE', '256'))
+
+# Maintenance Config
+MAINTENANCE_INTERVAL_HOURS = float(os.environ.get('MAINTENANCE_INTERVAL_HOURS', '24'))
+# Archived documents are no longer served by the API, so archiving is opt-in
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', '0'))
+MAINTENANCE_STARTUP_DELAY_SECONDS = float(os.environ.get('MAINTENANCE_STARTUP_DELAY_SECONDS', '300'))
+MAINTENANCE_BATCH_SIZE = 500
+WORKER_ID = uuid.uuid4().hex
+
+# Tracing Config
+PROFILE_DIR = Path(os.environ.get('PROFILE_DIR', ROOT_DIR / 'profiles'))
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', '5'))
+PROFILE_HEADER_ENABLED = os.environ.get('PROFILE_HEADER_ENABLED', 'false').lower() == 'true'
+
 # Subscription Plans
 SUBSCRIPTION_PLANS = {
-    "starter": {"name": "Starter", "price": 0.0, "analyses_limit": 3, "reports_limit": 3},
-    "pro": {"name": "Pro", "price": 49.0, "analyses_limit": -1, "reports_limit": -1},
-    "enterprise": {"name": "Enterprise", "price": 199.0, "analyses_limit": -1, "reports_limit": -1}
+    "starter": {"name": "Starter", "price": 0.0, "analyses_limit": 3, "reports_limit": 3,
+                "rate_limit": {"capacity": 5, "per_minute": 2}, "priority": 0},
+    "pro": {"name": "Pro", "price": 49.0, "analyses_limit": -1, "reports_limit": -1,
+            "rate_limit": {"capacity": 20, "per_minute": 10}, "priority": 1},
+    "enterprise": {"name": "Enterprise", "price": 199.0, "analyses_limit": -1, "reports_limit": -1,
+                   "rate_limit": {"capacity": 60, "per_minute": 30}, "priority": 2}
 }
 
-app = FastAPI(title="MarketPulse AI")
-api_router = APIRouter(prefix="/api")
+# Rate Limiting Config
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory')
+LLM_MAX_CONCURRENCY = int(os.environ.get('LLM_MAX_CONCURRENCY', '8'))
+LLM_ADMISSION_TIMEOUT = float(os.environ.get('LLM_ADMISSION_TIMEOUT', '30'))
+
+# ============= TRACING =============
+
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+trace_logger = logging.getLogger("marketpulse.trace")
+
+class RequestTrace:
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.spans: Dict[str, List[float]] = {}
+        self.handler_end: Optional[float] = None
+
+    def record(self, name: str, duration_ms: float):
+        totals = self.spans.setdefault(name, [0.0, 0])
+        totals[0] += duration_ms
+        totals[1] += 1
+
+    def server_timing(self, total_ms: float) -> str:
+        entries = [
+            f'{name};dur={duration:.1f};desc="{count}x"'
+            for name, (duration, count) in self.spans.items()
+        ]
+        entries.append(f"total;dur={total_ms:.1f}")
+        return ", ".join(entries)
+
+current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("current_trace", default=None)
+
+@contextmanager
+def span(name: str):
+    trace = current_trace.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if trace is not None:
+            trace.record(name, (time.perf_counter() - start) * 1000)
+
+class TracedRoute(APIRoute):
+    """Records an "app" span around the endpoint and a "serialize" span for
+    the response validation and rendering FastAPI does after it returns."""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        # include_router rebuilds routes from the already wrapped endpoint
+        if not getattr(endpoint, "_traced", False):
+            original = endpoint
+
+            @functools.wraps(original)
+            async def endpoint(*args, **kw):
+                with span("app"):
+                    result = await original(*args, **kw)
+                trace = current_trace.get()
+                if trace is not None:
+                    trace.handler_end = time.perf_counter()
+                return result
+
+            endpoint._traced = True
+        super().__init__(path, endpoint, **kwargs)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def traced_handler(request: Request) -> Response:
+            response = await handler(request)
+            trace = current_trace.get()
+            if trace is not None and trace.handler_end is not None:
+                trace.record("serialize", (time.perf_counter() - trace.handler_end) * 1000)
+            return response
+
+        return traced_handler
+
+class SamplingProfiler:
+    """Samples the event loop thread's stack on a background thread and
+    writes collapsed stacks (flamegraph.pl / speedscope format) on stop.
+
+    Stacks are wall-clock samples of the whole loop, so requests running
+    concurrently with the profiled one show up in the output too.
+    """
+
+    def __init__(self, request_id: str, thread_id: int):
+        self.path = PROFILE_DIR / f"{request_id}.folded"
+        self.thread_id = thread_id
+        self.samples: Dict[str, int] = {}
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> "SamplingProfiler":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        interval = PROFILE_INTERVAL_MS / 1000
+        while not self._stopped.wait(interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                key = ";".join(reversed(stack))
+                self.samples[key] = self.samples.get(key, 0) + 1
+        if self.samples:
+            try:
+                PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+                self.path.write_text("".join(f"{stack} {count}\n" for stack, count in self.samples.items()))
+            except OSError as e:
+                logging.error(f"Profile write error: {e}")
+
+class TracingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        headers = dict(scope["headers"])
+        request_id = headers.get(b"x-request-id", b"").decode("latin-1")
+        if not REQUEST_ID_PATTERN.match(request_id):
+            request_id = uuid.uuid4().hex
+        
+        profiler = None
+        if (PROFILE_HEADER_ENABLED and headers.get(b"x-profile") == b"1") or random.random() < PROFILE_SAMPLE_RATE:
+            profiler = SamplingProfiler(request_id, threading.get_ident()).start()
+        
+        trace = RequestTrace(request_id)
+        token = current_trace.set(trace)
+        start = time.perf_counter()
+        status_code = 500
+        
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                response_headers = MutableHeaders(scope=message)
+                response_headers.append("Server-Timing", trace.server_timing((time.perf_counter() - start) * 1000))
+                response_headers.append("X-Request-ID", request_id)
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_trace.reset(token)
+            if profiler is not None:
+                profiler.stop()
+            trace_logger.info(json.dumps({
+                "request_id": request_id,
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status_code,
+                "duration_ms": round((time.perf_counter() - start) * 1000, 2),
+                "spans": {name: round(duration, 2) for name, (duration, _) in trace.spans.items()},
+                "profiled": profiler is not None
+            }))
+
+# ============= LIFESPAN =============
+
+def validate_config():
+    if RATE_LIMIT_BACKEND not in ("memory", "mongo"):
+        raise RuntimeError(f"RATE_LIMIT_BACKEND must be 'memory' or 'mongo', got '{RATE_LIMIT_BACKEND}'")
+    if LLM_MAX_CONCURRENCY < 1:
+        raise RuntimeError("LLM_MAX_CONCURRENCY must be at least 1")
+    if not EMERGENT_LLM_KEY:
+        logging.warning("EMERGENT_LLM_KEY is not set, AI insights and reports are disabled")
+    if 'JWT_SECRET' not in os.environ:
+        logging.warning("JWT_SECRET is not set, tokens are signed with the default key")
+
+async def warm_mongo_pool():
+    # Concurrent pings open several pooled connections before the first request needs them
+    await asyncio.gather(*(client.admin.command("ping") for _ in range(MONGO_WARM_CONNECTIONS)))
+
+async def ensure_indexes():
+    await db.reports.create_index("analysis_id")
+    await db.reports.create_index("created_at")
+    await db.analyses.create_index("created_at")
+    await db.analyses.create_index("id")
+    await db.analyses.create_index([("user_id", 1), ("updated_at", -1)])
+    await db.locks.create_index("expires_at", expireAfterSeconds=0)
+    if RATE_LIMIT_BACKEND == "mongo":
+        await db.rate_limits.create_index("key", unique=True)
+        await db.rate_limits.create_index("expires_at", expireAfterSeconds=0)
+    await db.analyses_archive.create_index("id", unique=True)
+    await db.reports_archive.create_index("id", unique=True)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    validate_config()
+    await warm_mongo_pool()
+    await ensure_indexes()
+    if PRELOAD_LLM:
+        # Import in a thread so the worker starts serving right away
+        asyncio.get_running_loop().run_in_executor(None, llm_chat_classes)
+    maintenance_task = asyncio.create_task(maintenance_loop()) if MAINTENANCE_INTERVAL_HOURS > 0 else None
+    yield
+    if maintenance_task:
+        maintenance_task.cancel()
+    client.close()
+
+app = FastAPI(title="MarketPulse AI", lifespan=lifespan, default_response_class=ORJSONResponse)
+api_router = APIRouter(prefix="/api", route_class=TracedRoute)
 security = HTTPBearer()
 
 # ============= MODELS =============
@@ -82,6 +327,15 @@ class AnalysisCreate(BaseModel):
     target_market: str
     competitors: Optional[List[str]] = []
     description: Optional[str] = ""
+    reuse_similar: Optional[bool] = False
+    similarity_threshold: Optional[float] = Field(default=None, ge=0.0, le=1.0)
+
+class AnalysisUpdate(BaseModel):
+    title: Optional[str] = None
+    industry: Optional[str] = None
+    target_market: Optional[str] = None
+    competitors: Optional[List[str]] = None
+    description: Optional[str] = None
 
 class AnalysisResponse(BaseModel):
     id: str
@@ -94,9 +348,20 @@ class AnalysisResponse(BaseModel):
     status: str
     ai_insights: Optional[str] = None
     opportunities: List[dict] = []
+    insights_source_id: Optional[str] = None
+    insights_failed: bool = False
+    version: int = 1
     created_at: str
     updated_at: str
 
+class SimilarAnalysisResponse(BaseModel):
+    id: str
+    title: str
+    industry: str
+    target_market: str
+    similarity: float
+    created_at: str
+
 class OpportunityResponse(BaseModel):
     id: str
     analysis_id: str
@@ -111,6 +376,15 @@ class ReportCreate(BaseModel):
     analysis_id: str
     report_type: str  # "market_overview", "competitor_analysis", "opportunity_report"
 
+ReportType = Literal["market_overview", "competitor_analysis", "opportunity_report"]
+
+class ReportBundleCreate(BaseModel):
+    analysis_id: str
+    report_types: List[ReportType] = Field(
+        default_factory=lambda: ["market_overview", "competitor_analysis", "opportunity_report"],
+        min_length=1
+    )
+
 class ReportResponse(BaseModel):
     id: str
     user_id: str
@@ -119,6 +393,8 @@ class ReportResponse(BaseModel):
     title: str
     content: str
     status: str
+    analysis_version: int = 1
+    stale: bool = False
     created_at: str
 
 class DashboardStats(BaseModel):
@@ -144,11 +420,13 @@ def create_token(user_id: str) -> str:
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+        with span("jwt"):
+            payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
         user_id = payload.get("sub")
         if not user_id:
             raise HTTPException(status_code=401, detail="Invalid token")
-        user = await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0})
+        with span("user_lookup"):
+            user = await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0})
         if not user:
             raise HTTPException(status_code=401, detail="User not found")
         return user
@@ -157,13 +435,192 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+# ============= RATE LIMITING =============
+
+def user_plan(user: dict) -> dict:
+    # Accounts registered before paid plans existed carry the "free" tier
+    return SUBSCRIPTION_PLANS.get(user.get("subscription_tier"), SUBSCRIPTION_PLANS["starter"])
+
+class MemoryRateLimiter:
+    """Token buckets held in this process, keyed by user id."""
+
+    def __init__(self):
+        self.buckets: Dict[str, tuple] = {}
+
+    async def take(self, key: str, capacity: float, rate: float, cost: float) -> tuple:
+        now = time.monotonic()
+        tokens, updated = self.buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * rate)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        self.buckets[key] = (tokens, now)
+        return allowed, tokens
+
+    async def refund(self, key: str, capacity: float, cost: float):
+        if key in self.buckets:
+            tokens, updated = self.buckets[key]
+            self.buckets[key] = (min(capacity, tokens + cost), updated)
+
+class MongoRateLimiter:
+    """Token buckets shared by all workers, refilled and drawn in one atomic
+    pipeline update on db.rate_limits."""
+
+    async def take(self, key: str, capacity: float, rate: float, cost: float) -> tuple:
+        now = time.time()
+        pipeline = [
+            {"$set": {"tokens": {"$min": [capacity, {"$add": [
+                {"$ifNull": ["$tokens", capacity]},
+                {"$multiply": [{"$subtract": [now, {"$ifNull": ["$updated_at", now]}]}, rate]}
+            ]}]}}},
+            {"$set": {
+                "allowed": {"$gte": ["$tokens", cost]},
+                "updated_at": now,
+                "expires_at": datetime.now(timezone.utc) + timedelta(days=1)
+            }},
+            {"$set": {"tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", cost]}, "$tokens"]}}}
+        ]
+        try:
+            with span("db"):
+                bucket = await db.rate_limits.find_one_and_update(
+                    {"key": key}, pipeline, upsert=True, return_document=ReturnDocument.AFTER
+                )
+        except DuplicateKeyError:
+            # Two workers raced to create the bucket; the retry updates the winner's
+            with span("db"):
+                bucket = await db.rate_limits.find_one_and_update(
+                    {"key": key}, pipeline, return_document=ReturnDocument.AFTER
+                )
+        return bucket["allowed"], bucket["tokens"]
+
+    async def refund(self, key: str, capacity: float, cost: float):
+        with span("db"):
+            await db.rate_limits.update_one(
+                {"key": key},
+                [{"$set": {"tokens": {"$min": [capacity, {"$add": ["$tokens", cost]}]}}}]
+            )
+
+rate_limiter = MongoRateLimiter() if RATE_LIMIT_BACKEND == "mongo" else MemoryRateLimiter()
+
+async def check_rate_limit(user: dict, response: Response, cost: int = 1):
+    limits = user_plan(user)["rate_limit"]
+    capacity = limits["capacity"]
+    rate = limits["per_minute"] / 60
+    allowed, tokens = await rate_limiter.take(user["id"], capacity, rate, cost)
+    headers = {
+        "RateLimit-Limit": str(capacity),
+        "RateLimit-Remaining": str(int(tokens)),
+        "RateLimit-Reset": str(math.ceil((capacity - tokens) / rate))
+    }
+    if not allowed:
+        headers["Retry-After"] = str(math.ceil((cost - tokens) / rate))
+        raise HTTPException(status_code=429, detail="Trop de requêtes, veuillez réessayer plus tard", headers=headers)
+    response.headers.update(headers)
+
+async def refund_rate_limit(user: dict, cost: int = 1):
+    await rate_limiter.refund(user["id"], user_plan(user)["rate_limit"]["capacity"], cost)
+
+async def rate_limited_user(response: Response, user: dict = Depends(get_current_user)):
+    await check_rate_limit(user, response)
+    try:
+        yield user
+    except HTTPException as e:
+        # Requests turned away by LLM admission did no work, so don't charge for them
+        if e.status_code == 503:
+            await refund_rate_limit(user)
+        raise
+
+class LlmAdmission:
+    """Caps concurrent LLM calls across the process. Once saturated, freed
+    slots go to the waiter with the highest plan priority, FIFO within a plan."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self.waiters: List[tuple] = []
+        self._order = itertools.count()
+
+    @asynccontextmanager
+    async def slot(self, priority: int):
+        await self._acquire(priority)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self, priority: int):
+        if self.active < self.limit and not self.waiters:
+            self.active += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (-priority, next(self._order), future))
+        try:
+            await asyncio.wait_for(future, LLM_ADMISSION_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise HTTPException(
+                status_code=503,
+                detail="Service saturé, veuillez réessayer dans quelques instants",
+                headers={"Retry-After": str(math.ceil(LLM_ADMISSION_TIMEOUT))}
+            )
+        except asyncio.CancelledError:
+            # The slot may have been handed over just as the request went away
+            if future.done() and not future.cancelled():
+                self._release()
+            raise
+
+    def _release(self):
+        while self.waiters:
+            _, _, future = heapq.heappop(self.waiters)
+            if not future.done():
+                # Hand the slot over directly so newcomers can't jump the queue
+                future.set_result(None)
+                return
+        self.active -= 1
+
+llm_admission = LlmAdmission(LLM_MAX_CONCURRENCY)
+
 # ============= AI SERVICE =============
 
+@functools.lru_cache(maxsize=None)
+def llm_chat_classes():
+    # emergentintegrations pulls in litellm, openai and the google SDKs, so it
+    # is imported on the first LLM call rather than at worker boot
+    from emergentintegrations.llm.chat import LlmChat, UserMessage
+    return LlmChat, UserMessage
+
+# Every field that ends up in the insights prompt
+PROMPT_FIELDS = ("title", "industry", "target_market", "competitors", "description")
+
+def analysis_input_hash(analysis: dict) -> str:
+    payload = {field: analysis.get(field) or ([] if field == "competitors" else "") for field in PROMPT_FIELDS}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+def build_opportunities(analysis: dict) -> List[dict]:
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "title": f"Opportunité marché {analysis.get('target_market', '')}",
+            "description": "Opportunité identifiée par l'analyse IA",
+            "potential_revenue": "50K - 200K €",
+            "risk_level": "medium",
+            "priority": "high"
+        }
+    ]
+
+class FailedInsights(str):
+    """Fallback text generate_ai_insights returns when the LLM produced nothing.
+    It is still shown to the user, but the analysis is flagged so its
+    insights are never reused."""
+
+# Matches fallback texts stored before analyses carried insights_failed
+FAILED_INSIGHTS_PATTERN = re.compile(r"^(AI insights unavailable|Erreur lors de la génération des insights)")
+
 async def generate_ai_insights(analysis: dict) -> str:
     if not EMERGENT_LLM_KEY:
-        return "AI insights unavailable - API key not configured"
+        return FailedInsights("AI insights unavailable - API key not configured")
     
     try:
+        LlmChat, UserMessage = llm_chat_classes()
         chat = LlmChat(
             api_key=EMERGENT_LLM_KEY,
             session_id=f"analysis-{analysis.get('id', 'default')}",
@@ -186,47 +643,239 @@ Fournis:
 
 Format ta réponse de manière concise et professionnelle."""
 
-        response = await chat.send_message(UserMessage(text=prompt))
+        with span("llm"):
+            response = await chat.send_message(UserMessage(text=prompt))
         return response
     except Exception as e:
         logging.error(f"AI generation error: {e}")
-        return f"Erreur lors de la génération des insights: {str(e)}"
+        return FailedInsights(f"Erreur lors de la génération des insights: {str(e)}")
+
+REPORT_TYPE_PROMPTS = {
+    "market_overview": "Génère un rapport complet d'aperçu du marché incluant: taille du marché, tendances, acteurs clés, facteurs de croissance.",
+    "competitor_analysis": "Génère une analyse concurrentielle détaillée: forces/faiblesses des concurrents, positionnement, stratégies, parts de marché estimées.",
+    "opportunity_report": "Génère un rapport d'opportunités: opportunités identifiées, potentiel de revenus, plan d'action recommandé, timeline."
+}
+
+REPORT_TYPE_TITLES = {
+    "market_overview": "Aperçu du Marché",
+    "competitor_analysis": "Analyse Concurrentielle",
+    "opportunity_report": "Rapport d'Opportunités"
+}
+
+def build_report_context(analysis: dict) -> str:
+    return f"""Données de l'analyse:
+- Titre: {analysis.get('title', '')}
+- Industrie: {analysis.get('industry', '')}
+- Marché cible: {analysis.get('target_market', '')}
+- Concurrents: {', '.join(analysis.get('competitors', []))}
+- Description: {analysis.get('description', '')}
+- Insights précédents: {analysis.get('ai_insights', '')}"""
 
-async def generate_report_content(analysis: dict, report_type: str) -> str:
+async def generate_report_content(analysis: dict, report_type: str, context: Optional[str] = None) -> str:
     if not EMERGENT_LLM_KEY:
         return "Rapport non disponible - Clé API non configurée"
     
     try:
+        LlmChat, UserMessage = llm_chat_classes()
         chat = LlmChat(
             api_key=EMERGENT_LLM_KEY,
             session_id=f"report-{analysis.get('id', 'default')}-{report_type}",
             system_message="Tu es un consultant senior en stratégie d'entreprise. Tu rédiges des rapports professionnels et détaillés en français."
         ).with_model("openai", "gpt-5.2")
         
-        type_prompts = {
-            "market_overview": "Génère un rapport complet d'aperçu du marché incluant: taille du marché, tendances, acteurs clés, facteurs de croissance.",
-            "competitor_analysis": "Génère une analyse concurrentielle détaillée: forces/faiblesses des concurrents, positionnement, stratégies, parts de marché estimées.",
-            "opportunity_report": "Génère un rapport d'opportunités: opportunités identifiées, potentiel de revenus, plan d'action recommandé, timeline."
-        }
-        
-        prompt = f"""{type_prompts.get(report_type, type_prompts['market_overview'])}
+        prompt = f"""{REPORT_TYPE_PROMPTS.get(report_type, REPORT_TYPE_PROMPTS['market_overview'])}
 
-Données de l'analyse:
-- Titre: {analysis.get('title', '')}
-- Industrie: {analysis.get('industry', '')}
-- Marché cible: {analysis.get('target_market', '')}
-- Concurrents: {', '.join(analysis.get('competitors', []))}
-- Description: {analysis.get('description', '')}
-- Insights précédents: {analysis.get('ai_insights', '')}
+{context or build_report_context(analysis)}
 
 Génère un rapport professionnel et structuré avec des sections claires."""
 
-        response = await chat.send_message(UserMessage(text=prompt))
+        with span("llm"):
+            response = await chat.send_message(UserMessage(text=prompt))
         return response
     except Exception as e:
         logging.error(f"Report generation error: {e}")
         return f"Erreur lors de la génération du rapport: {str(e)}"
 
+# ============= SIMILARITY INDEX =============
+
+SIMILARITY_FIELDS = {"title": 1.0, "industry": 2.0, "target_market": 2.0, "competitors": 1.0, "description": 1.0}
+TOKEN_PATTERN = re.compile(r"\w+")
+
+def analysis_terms(analysis: dict) -> Dict[str, float]:
+    terms: Dict[str, float] = {}
+    for field, weight in SIMILARITY_FIELDS.items():
+        value = analysis.get(field) or ""
+        if isinstance(value, list):
+            value = " ".join(value)
+        for token in TOKEN_PATTERN.findall(value.lower()):
+            if len(token) > 1:
+                terms[token] = terms.get(token, 0.0) + weight
+    return terms
+
+@functools.lru_cache(maxsize=None)
+def numpy_module():
+    # Only the similarity index needs numpy, so it is imported on first use
+    # rather than at worker boot
+    import numpy
+    return numpy
+
+class AnalysisSimilarityIndex:
+    """TF-IDF index over analysis input fields.
+
+    Term counts live in a numpy matrix (one row per analysis, one column per
+    term) that grows by doubling, so inserts and deletes are incremental and
+    queries are a single matrix-vector product. `watermark` is the
+    (count, max updated_at) of the user's analyses the index reflects.
+    """
+
+    def __init__(self, rows: int = 16, columns: int = 64):
+        np = numpy_module()
+        self.vocabulary: Dict[str, int] = {}
+        self.ids: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self.counts = np.zeros((max(rows, 1), max(columns, 1)), dtype=np.float32)
+        self.doc_freq = np.zeros(max(columns, 1), dtype=np.float32)
+        self.watermark: tuple = (0, None)
+
+    @classmethod
+    def build(cls, analyses: List[dict]) -> "AnalysisSimilarityIndex":
+        # Size the matrix exactly up front instead of doubling into it
+        vocabulary = set()
+        for a in analyses:
+            vocabulary.update(analysis_terms(a))
+        index = cls(rows=len(analyses), columns=len(vocabulary))
+        for a in analyses:
+            index.insert(a["id"], a)
+        return index
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _column(self, term: str) -> int:
+        col = self.vocabulary.get(term)
+        if col is None:
+            col = len(self.vocabulary)
+            self.vocabulary[term] = col
+            width = self.counts.shape[1]
+            if col >= width:
+                np = numpy_module()
+                self.counts = np.pad(self.counts, ((0, 0), (0, width)))
+                self.doc_freq = np.pad(self.doc_freq, (0, width))
+        return col
+
+    def insert(self, analysis_id: str, analysis: dict):
+        if analysis_id in self.rows:
+            self.remove(analysis_id)
+        row = len(self.ids)
+        if row >= self.counts.shape[0]:
+            np = numpy_module()
+            self.counts = np.pad(self.counts, ((0, self.counts.shape[0]), (0, 0)))
+        for term, count in analysis_terms(analysis).items():
+            col = self._column(term)
+            self.counts[row, col] = count
+            self.doc_freq[col] += 1
+        self.ids.append(analysis_id)
+        self.rows[analysis_id] = row
+
+    def remove(self, analysis_id: str):
+        row = self.rows.pop(analysis_id, None)
+        if row is None:
+            return
+        self.doc_freq -= self.counts[row] > 0
+        last = len(self.ids) - 1
+        if row != last:
+            self.counts[row] = self.counts[last]
+            self.ids[row] = self.ids[last]
+            self.rows[self.ids[row]] = row
+        self.counts[last] = 0
+        self.ids.pop()
+
+    def query(self, analysis: dict, limit: int = 5, threshold: float = 0.0, exclude_id: Optional[str] = None) -> List[tuple]:
+        n = len(self.ids)
+        if n == 0:
+            return []
+        np = numpy_module()
+        width = len(self.vocabulary)
+        idf = np.log((1 + n) / (1 + self.doc_freq[:width])) + 1
+        matrix = self.counts[:n, :width] * idf
+
+        vector = np.zeros(width, dtype=np.float32)
+        unseen = 0.0
+        for term, count in analysis_terms(analysis).items():
+            col = self.vocabulary.get(term)
+            if col is None:
+                unseen += (count * (np.log(1 + n) + 1)) ** 2
+            else:
+                vector[col] = count * idf[col]
+        query_norm = np.sqrt(vector @ vector + unseen)
+        if query_norm == 0:
+            return []
+
+        norms = np.linalg.norm(matrix, axis=1) * query_norm
+        scores = np.divide(matrix @ vector, norms, out=np.zeros(n, dtype=np.float32), where=norms > 0)
+        if exclude_id in self.rows:
+            scores[self.rows[exclude_id]] = -1
+        top = np.argsort(-scores)[:limit]
+        return [(self.ids[i], float(scores[i])) for i in top if scores[i] >= threshold]
+
+# Least recently used indexes are evicted beyond SIMILARITY_CACHE_SIZE users
+similarity_indexes: "OrderedDict[str, AnalysisSimilarityIndex]" = OrderedDict()
+
+async def analyses_watermark(user_id: str) -> tuple:
+    with span("db"):
+        result = await db.analyses.aggregate([
+            {"$match": {"user_id": user_id}},
+            {"$group": {"_id": None, "count": {"$sum": 1}, "updated_at": {"$max": "$updated_at"}}}
+        ]).to_list(1)
+    return (result[0]["count"], result[0]["updated_at"]) if result else (0, None)
+
+async def get_similarity_index(user_id: str) -> AnalysisSimilarityIndex:
+    # Other workers write to the same collection, so rebuild whenever this
+    # worker's copy no longer matches what Mongo holds for the user
+    watermark = await analyses_watermark(user_id)
+    index = similarity_indexes.get(user_id)
+    if index is None or index.watermark != watermark:
+        with span("db"):
+            analyses = await db.analyses.find(
+                {"user_id": user_id},
+                {"_id": 0, "id": 1, **{field: 1 for field in SIMILARITY_FIELDS}}
+            ).to_list(None)
+        index = AnalysisSimilarityIndex.build(analyses)
+        index.watermark = watermark
+        similarity_indexes[user_id] = index
+    similarity_indexes.move_to_end(user_id)
+    while len(similarity_indexes) > SIMILARITY_CACHE_SIZE:
+        similarity_indexes.popitem(last=False)
+    return index
+
+def update_similarity_index(user_id: str, analysis_id: str, analysis: Optional[dict] = None):
+    """Apply this worker's own write to its cached index, or drop the entry
+    when `analysis` is None, and advance the watermark to match."""
+    index = similarity_indexes.get(user_id)
+    if index is None:
+        return
+    count, updated_at = index.watermark
+    if analysis is None:
+        if analysis_id in index.rows:
+            index.remove(analysis_id)
+            count -= 1
+    else:
+        if analysis_id not in index.rows:
+            count += 1
+        index.insert(analysis_id, analysis)
+        updated_at = max(updated_at or "", analysis["updated_at"])
+    index.watermark = (count, updated_at)
+
+# ============= RESPONSES =============
+
+def trusted_response(model, docs) -> ORJSONResponse:
+    # Documents read from our own collections were validated when written, so
+    # build the models without validation and serialize them once with orjson
+    # instead of validating here and again through response_model.
+    if isinstance(docs, list):
+        return ORJSONResponse([model.model_construct(**d).model_dump() for d in docs])
+    return ORJSONResponse(model.model_construct(**docs).model_dump())
+
 # ============= AUTH ROUTES =============
 
 @api_router.post("/auth/register", response_model=TokenResponse)
@@ -293,7 +942,7 @@ async def get_me(user: dict = Depends(get_current_user)):
 # ============= ANALYSES ROUTES =============
 
 @api_router.post("/analyses", response_model=AnalysisResponse)
-async def create_analysis(data: AnalysisCreate, user: dict = Depends(get_current_user)):
+async def create_analysis(data: AnalysisCreate, user: dict = Depends(rate_limited_user)):
     analysis_id = str(uuid.uuid4())
     now = datetime.now(timezone.utc).isoformat()
     
@@ -308,76 +957,224 @@ async def create_analysis(data: AnalysisCreate, user: dict = Depends(get_current
         "status": "processing",
         "ai_insights": None,
         "opportunities": [],
+        "insights_source_id": None,
+        "insights_failed": False,
+        "input_hash": None,
+        "version": 1,
         "created_at": now,
         "updated_at": now
     }
     
-    await db.analyses.insert_one(analysis)
+    analysis["input_hash"] = analysis_input_hash(analysis)
     
-    # Generate AI insights
-    ai_insights = await generate_ai_insights(analysis)
+    source = None
+    if data.reuse_similar:
+        index = await get_similarity_index(user["id"])
+        threshold = data.similarity_threshold if data.similarity_threshold is not None else SIMILARITY_THRESHOLD
+        for match_id, _ in index.query(analysis, limit=5, threshold=threshold):
+            with span("db"):
+                source = await db.analyses.find_one(
+                    {
+                        "id": match_id,
+                        "user_id": user["id"],
+                        "status": "completed",
+                        "insights_failed": {"$ne": True},
+                        "ai_insights": {"$ne": None, "$not": FAILED_INSIGHTS_PATTERN}
+                    },
+                    {"_id": 0, "id": 1, "ai_insights": 1}
+                )
+            if source:
+                break
+    
+    # Wait for an LLM slot before persisting anything, so an admission timeout
+    # doesn't leave an analysis stuck in "processing"
+    admission = nullcontext() if source else llm_admission.slot(user_plan(user)["priority"])
+    async with admission:
+        with span("db"):
+            await db.analyses.insert_one(analysis)
+        
+        # Generate AI insights, or reuse them from a near-identical analysis
+        if source:
+            ai_insights = source["ai_insights"]
+            analysis["insights_source_id"] = source["id"]
+        else:
+            ai_insights = await generate_ai_insights(analysis)
+    analysis["insights_failed"] = isinstance(ai_insights, FailedInsights)
+    ai_insights = str(ai_insights)
     
     # Generate opportunities from AI
-    opportunities = [
-        {
-            "id": str(uuid.uuid4()),
-            "title": f"Opportunité marché {data.target_market}",
-            "description": "Opportunité identifiée par l'analyse IA",
-            "potential_revenue": "50K - 200K €",
-            "risk_level": "medium",
-            "priority": "high"
-        }
-    ]
+    opportunities = build_opportunities(analysis)
     
-    await db.analyses.update_one(
-        {"id": analysis_id},
-        {"$set": {
-            "ai_insights": ai_insights,
-            "opportunities": opportunities,
-            "status": "completed",
-            "updated_at": datetime.now(timezone.utc).isoformat()
-        }}
-    )
+    # Guard on the initial version so a late write never clobbers a newer one
+    completed_at = datetime.now(timezone.utc).isoformat()
+    with span("db"):
+        result = await db.analyses.update_one(
+            {"id": analysis_id, "version": 1},
+            {"$set": {
+                "ai_insights": ai_insights,
+                "opportunities": opportunities,
+                "insights_source_id": analysis["insights_source_id"],
+                "insights_failed": analysis["insights_failed"],
+                "status": "completed",
+                "updated_at": completed_at
+            }}
+        )
+    if result.matched_count == 0:
+        with span("db"):
+            current = await db.analyses.find_one({"id": analysis_id, "user_id": user["id"]}, {"_id": 0})
+        if not current:
+            raise HTTPException(status_code=404, detail="Analyse non trouvée")
+        return AnalysisResponse(**current)
     
     analysis["ai_insights"] = ai_insights
     analysis["opportunities"] = opportunities
     analysis["status"] = "completed"
+    analysis["updated_at"] = completed_at
+    update_similarity_index(user["id"], analysis_id, analysis)
     
     return AnalysisResponse(**analysis)
 
 @api_router.get("/analyses", response_model=List[AnalysisResponse])
 async def get_analyses(user: dict = Depends(get_current_user)):
-    analyses = await db.analyses.find(
-        {"user_id": user["id"]},
-        {"_id": 0}
-    ).sort("created_at", -1).to_list(100)
-    return [AnalysisResponse(**a) for a in analyses]
+    with span("db"):
+        analyses = await db.analyses.find(
+            {"user_id": user["id"]},
+            {"_id": 0}
+        ).sort("created_at", -1).to_list(100)
+    return trusted_response(AnalysisResponse, analyses)
 
 @api_router.get("/analyses/{analysis_id}", response_model=AnalysisResponse)
 async def get_analysis(analysis_id: str, user: dict = Depends(get_current_user)):
-    analysis = await db.analyses.find_one(
-        {"id": analysis_id, "user_id": user["id"]},
-        {"_id": 0}
-    )
+    with span("db"):
+        analysis = await db.analyses.find_one(
+            {"id": analysis_id, "user_id": user["id"]},
+            {"_id": 0}
+        )
     if not analysis:
         raise HTTPException(status_code=404, detail="Analyse non trouvée")
-    return AnalysisResponse(**analysis)
+    return trusted_response(AnalysisResponse, analysis)
+
+@api_router.patch("/analyses/{analysis_id}", response_model=AnalysisResponse)
+async def update_analysis(analysis_id: str, data: AnalysisUpdate, user: dict = Depends(rate_limited_user)):
+    with span("db"):
+        analysis = await db.analyses.find_one(
+            {"id": analysis_id, "user_id": user["id"]},
+            {"_id": 0}
+        )
+    if not analysis:
+        raise HTTPException(status_code=404, detail="Analyse non trouvée")
+    if analysis.get("status") == "processing":
+        raise HTTPException(status_code=409, detail="L'analyse est en cours de génération, veuillez réessayer")
+    
+    changes = {
+        field: value
+        for field, value in data.model_dump(exclude_unset=True).items()
+        if value is not None and value != analysis.get(field)
+    }
+    if not changes:
+        return AnalysisResponse(**analysis)
+    
+    updated = {**analysis, **changes}
+    version = analysis.get("version", 1)
+    input_hash = analysis_input_hash(updated)
+    previous_hash = analysis.get("input_hash") or analysis_input_hash(analysis)
+    
+    update = {
+        **changes,
+        "input_hash": input_hash,
+        "version": version + 1,
+        "updated_at": datetime.now(timezone.utc).isoformat()
+    }
+    prompt_changed = input_hash != previous_hash
+    if prompt_changed:
+        async with llm_admission.slot(user_plan(user)["priority"]):
+            ai_insights = await generate_ai_insights(updated)
+        update["ai_insights"] = str(ai_insights)
+        update["insights_failed"] = isinstance(ai_insights, FailedInsights)
+        update["opportunities"] = build_opportunities(updated)
+        update["insights_source_id"] = None
+    
+    # Only apply the update if nobody else bumped the version in the meantime
+    version_filter = {"version": version} if "version" in analysis else {"version": {"$exists": False}}
+    with span("db"):
+        result = await db.analyses.update_one(
+            {"id": analysis_id, "user_id": user["id"], **version_filter},
+            {"$set": update}
+        )
+    if result.matched_count == 0:
+        raise HTTPException(status_code=409, detail="L'analyse a été modifiée entre-temps, veuillez réessayer")
+    
+    if prompt_changed:
+        with span("db"):
+            await db.reports.update_many(
+                {"analysis_id": analysis_id, "user_id": user["id"]},
+                {"$set": {"stale": True}}
+            )
+    
+    updated.update(update)
+    update_similarity_index(user["id"], analysis_id, updated)
+    
+    return AnalysisResponse(**updated)
+
+@api_router.get("/analyses/{analysis_id}/similar", response_model=List[SimilarAnalysisResponse])
+async def get_similar_analyses(
+    analysis_id: str,
+    limit: int = Query(5, ge=1, le=50),
+    threshold: Optional[float] = Query(None, ge=0.0, le=1.0),
+    user: dict = Depends(get_current_user)
+):
+    with span("db"):
+        analysis = await db.analyses.find_one(
+            {"id": analysis_id, "user_id": user["id"]},
+            {"_id": 0}
+        )
+    if not analysis:
+        raise HTTPException(status_code=404, detail="Analyse non trouvée")
+    
+    index = await get_similarity_index(user["id"])
+    matches = index.query(
+        analysis,
+        limit=limit,
+        threshold=threshold if threshold is not None else SIMILARITY_THRESHOLD,
+        exclude_id=analysis_id
+    )
+    if not matches:
+        return []
+    
+    # The index is per-worker, so confirm matches still exist before returning them
+    with span("db"):
+        found = await db.analyses.find(
+            {"id": {"$in": [match_id for match_id, _ in matches]}, "user_id": user["id"]},
+            {"_id": 0, "id": 1, "title": 1, "industry": 1, "target_market": 1, "created_at": 1}
+        ).to_list(limit)
+    by_id = {a["id"]: a for a in found}
+    return [
+        SimilarAnalysisResponse(**by_id[match_id], similarity=round(score, 4))
+        for match_id, score in matches
+        if match_id in by_id
+    ]
 
 @api_router.delete("/analyses/{analysis_id}")
 async def delete_analysis(analysis_id: str, user: dict = Depends(get_current_user)):
-    result = await db.analyses.delete_one({"id": analysis_id, "user_id": user["id"]})
+    with span("db"):
+        result = await db.analyses.delete_one({"id": analysis_id, "user_id": user["id"]})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Analyse non trouvée")
-    return {"message": "Analyse supprimée"}
+    # Opportunities are embedded in the analysis document; reports are not
+    with span("db"):
+        reports = await db.reports.delete_many({"analysis_id": analysis_id, "user_id": user["id"]})
+    update_similarity_index(user["id"], analysis_id)
+    return {"message": "Analyse supprimée", "deleted_reports": reports.deleted_count}
 
 # ============= OPPORTUNITIES ROUTES =============
 
 @api_router.get("/opportunities", response_model=List[OpportunityResponse])
 async def get_opportunities(user: dict = Depends(get_current_user)):
-    analyses = await db.analyses.find(
-        {"user_id": user["id"]},
-        {"_id": 0, "opportunities": 1, "id": 1}
-    ).to_list(100)
+    with span("db"):
+        analyses = await db.analyses.find(
+            {"user_id": user["id"]},
+            {"_id": 0, "opportunities": 1, "id": 1}
+        ).to_list(100)
     
     all_opportunities = []
     for analysis in analyses:
@@ -397,69 +1194,116 @@ async def get_opportunities(user: dict = Depends(get_current_user)):
 
 # ============= REPORTS ROUTES =============
 
+def build_report(user: dict, analysis: dict, report_type: str, content: str) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "user_id": user["id"],
+        "analysis_id": analysis["id"],
+        "report_type": report_type,
+        "title": f"{REPORT_TYPE_TITLES.get(report_type, 'Rapport')} - {analysis['title']}",
+        "content": content,
+        "status": "completed",
+        "analysis_version": analysis.get("version", 1),
+        "stale": False,
+        "created_at": datetime.now(timezone.utc).isoformat()
+    }
+
 @api_router.post("/reports", response_model=ReportResponse)
-async def create_report(data: ReportCreate, user: dict = Depends(get_current_user)):
-    analysis = await db.analyses.find_one(
-        {"id": data.analysis_id, "user_id": user["id"]},
-        {"_id": 0}
-    )
+async def create_report(data: ReportCreate, user: dict = Depends(rate_limited_user)):
+    with span("db"):
+        analysis = await db.analyses.find_one(
+            {"id": data.analysis_id, "user_id": user["id"]},
+            {"_id": 0}
+        )
     if not analysis:
         raise HTTPException(status_code=404, detail="Analyse non trouvée")
     
-    report_id = str(uuid.uuid4())
-    now = datetime.now(timezone.utc).isoformat()
+    async with llm_admission.slot(user_plan(user)["priority"]):
+        content = await generate_report_content(analysis, data.report_type)
     
-    content = await generate_report_content(analysis, data.report_type)
+    report = build_report(user, analysis, data.report_type, content)
     
-    type_titles = {
-        "market_overview": "Aperçu du Marché",
-        "competitor_analysis": "Analyse Concurrentielle",
-        "opportunity_report": "Rapport d'Opportunités"
-    }
+    with span("db"):
+        await db.reports.insert_one(report)
+    return ReportResponse(**report)
+
+@api_router.post("/reports/bundle", response_model=List[ReportResponse])
+async def create_report_bundle(data: ReportBundleCreate, response: Response, user: dict = Depends(get_current_user)):
+    with span("db"):
+        analysis = await db.analyses.find_one(
+            {"id": data.analysis_id, "user_id": user["id"]},
+            {"_id": 0}
+        )
+    if not analysis:
+        raise HTTPException(status_code=404, detail="Analyse non trouvée")
     
-    report = {
-        "id": report_id,
-        "user_id": user["id"],
-        "analysis_id": data.analysis_id,
-        "report_type": data.report_type,
-        "title": f"{type_titles.get(data.report_type, 'Rapport')} - {analysis['title']}",
-        "content": content,
-        "status": "completed",
-        "created_at": now
-    }
+    report_types = list(dict.fromkeys(data.report_types))
+    await check_rate_limit(user, response, cost=len(report_types))
     
-    await db.reports.insert_one(report)
-    return ReportResponse(**report)
+    # One context prompt and one admission priority shared by every report
+    context = build_report_context(analysis)
+    priority = user_plan(user)["priority"]
+    
+    admitted = 0
+    
+    async def generate(report_type: str) -> str:
+        nonlocal admitted
+        async with llm_admission.slot(priority):
+            admitted += 1
+            return await generate_report_content(analysis, report_type, context)
+    
+    # A TaskGroup cancels the sibling reports as soon as one is refused admission
+    try:
+        async with asyncio.TaskGroup() as group:
+            tasks = [group.create_task(generate(report_type)) for report_type in report_types]
+    except* HTTPException as errors:
+        # Only refund the reports whose LLM call never started
+        await refund_rate_limit(user, cost=len(report_types) - admitted)
+        raise errors.exceptions[0]
+    contents = [task.result() for task in tasks]
+    reports = [
+        build_report(user, analysis, report_type, content)
+        for report_type, content in zip(report_types, contents)
+    ]
+    
+    with span("db"):
+        await db.reports.insert_many(reports)
+    return [ReportResponse(**r) for r in reports]
 
 @api_router.get("/reports", response_model=List[ReportResponse])
 async def get_reports(user: dict = Depends(get_current_user)):
-    reports = await db.reports.find(
-        {"user_id": user["id"]},
-        {"_id": 0}
-    ).sort("created_at", -1).to_list(100)
-    return [ReportResponse(**r) for r in reports]
+    with span("db"):
+        reports = await db.reports.find(
+            {"user_id": user["id"]},
+            {"_id": 0}
+        ).sort("created_at", -1).to_list(100)
+    return trusted_response(ReportResponse, reports)
 
 @api_router.get("/reports/{report_id}", response_model=ReportResponse)
 async def get_report(report_id: str, user: dict = Depends(get_current_user)):
-    report = await db.reports.find_one(
-        {"id": report_id, "user_id": user["id"]},
-        {"_id": 0}
-    )
+    with span("db"):
+        report = await db.reports.find_one(
+            {"id": report_id, "user_id": user["id"]},
+            {"_id": 0}
+        )
     if not report:
         raise HTTPException(status_code=404, detail="Rapport non trouvé")
-    return ReportResponse(**report)
+    return trusted_response(ReportResponse, report)
 
 # ============= DASHBOARD ROUTES =============
 
 @api_router.get("/dashboard/stats", response_model=DashboardStats)
 async def get_dashboard_stats(user: dict = Depends(get_current_user)):
-    total_analyses = await db.analyses.count_documents({"user_id": user["id"]})
-    total_reports = await db.reports.count_documents({"user_id": user["id"]})
+    with span("db"):
+        total_analyses = await db.analyses.count_documents({"user_id": user["id"]})
+    with span("db"):
+        total_reports = await db.reports.count_documents({"user_id": user["id"]})
     
-    analyses = await db.analyses.find(
-        {"user_id": user["id"]},
-        {"_id": 0}
-    ).sort("created_at", -1).to_list(100)
+    with span("db"):
+        analyses = await db.analyses.find(
+            {"user_id": user["id"]},
+            {"_id": 0}
+        ).sort("created_at", -1).to_list(100)
     
     all_opportunities = []
     high_priority = 0
@@ -495,6 +1339,116 @@ async def get_dashboard_stats(user: dict = Depends(get_current_user)):
         top_opportunities=all_opportunities[:5]
     )
 
+# ============= MAINTENANCE =============
+
+def compress_document(doc: dict) -> bytes:
+    return zlib.compress(json.dumps(doc, ensure_ascii=False).encode('utf-8'))
+
+async def move_to_archive(collection, archive, docs: List[dict]):
+    archived_at = datetime.now(timezone.utc).isoformat()
+    # Upserts keep a retried batch from creating duplicate archive entries
+    await archive.bulk_write([
+        ReplaceOne(
+            {"id": doc["id"]},
+            {
+                "id": doc["id"],
+                "user_id": doc.get("user_id"),
+                "created_at": doc.get("created_at"),
+                "archived_at": archived_at,
+                "body": Binary(compress_document(doc))
+            },
+            upsert=True
+        )
+        for doc in docs
+    ], ordered=False)
+    await collection.delete_many({"id": {"$in": [doc["id"] for doc in docs]}})
+
+async def archive_matching(collection, archive, query: dict) -> int:
+    archived = 0
+    while True:
+        docs = await collection.find(query, {"_id": 0}).limit(MAINTENANCE_BATCH_SIZE).to_list(MAINTENANCE_BATCH_SIZE)
+        if not docs:
+            return archived
+        await move_to_archive(collection, archive, docs)
+        archived += len(docs)
+
+async def archive_old_data(max_age_days: int) -> Dict[str, int]:
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=max_age_days)).isoformat()
+    archived = {"analyses": 0, "reports": 0}
+    while True:
+        analyses = await db.analyses.find(
+            {"created_at": {"$lt": cutoff}},
+            {"_id": 0}
+        ).limit(MAINTENANCE_BATCH_SIZE).to_list(MAINTENANCE_BATCH_SIZE)
+        if not analyses:
+            break
+        # Reports follow their analysis so they never show up as orphans
+        archived["reports"] += await archive_matching(
+            db.reports, db.reports_archive,
+            {"analysis_id": {"$in": [a["id"] for a in analyses]}}
+        )
+        await move_to_archive(db.analyses, db.analyses_archive, analyses)
+        archived["analyses"] += len(analyses)
+    archived["reports"] += await archive_matching(db.reports, db.reports_archive, {"created_at": {"$lt": cutoff}})
+    return archived
+
+async def delete_reports_for(analysis_ids: List[str]) -> int:
+    result = await db.reports.delete_many({"analysis_id": {"$in": analysis_ids}})
+    return result.deleted_count
+
+async def remove_orphan_reports() -> int:
+    # Streamed through a cursor, so the number of analyses isn't bounded by
+    # a single 16MB reply the way distinct() is
+    cursor = db.reports.aggregate([
+        {"$group": {"_id": "$analysis_id"}},
+        {"$lookup": {"from": "analyses", "localField": "_id", "foreignField": "id", "as": "live"}},
+        {"$match": {"live": {"$size": 0}}},
+        {"$lookup": {"from": "analyses_archive", "localField": "_id", "foreignField": "id", "as": "archived"}},
+        {"$match": {"archived": {"$size": 0}}},
+        {"$project": {"_id": 1}}
+    ], allowDiskUse=True, batchSize=MAINTENANCE_BATCH_SIZE)
+    removed = 0
+    orphans = []
+    async for group in cursor:
+        orphans.append(group["_id"])
+        if len(orphans) >= MAINTENANCE_BATCH_SIZE:
+            removed += await delete_reports_for(orphans)
+            orphans = []
+    if orphans:
+        removed += await delete_reports_for(orphans)
+    return removed
+
+async def run_maintenance():
+    orphans = await remove_orphan_reports()
+    archived = await archive_old_data(ARCHIVE_AFTER_DAYS) if ARCHIVE_AFTER_DAYS > 0 else {}
+    logging.info(f"Maintenance done: {orphans} orphan reports removed, archived {archived}")
+
+async def acquire_maintenance_lease(duration: float) -> bool:
+    now = datetime.now(timezone.utc)
+    try:
+        # Matches only an expired lease; otherwise the upsert collides on _id
+        await db.locks.update_one(
+            {"_id": "maintenance", "expires_at": {"$lt": now}},
+            {"$set": {"owner": WORKER_ID, "expires_at": now + timedelta(seconds=duration)}},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        return False
+
+async def maintenance_loop():
+    interval = MAINTENANCE_INTERVAL_HOURS * 3600
+    # A short random delay keeps maintenance off the boot path and spreads
+    # workers that started together; the lease keeps it to one run per interval
+    await asyncio.sleep(random.uniform(0, MAINTENANCE_STARTUP_DELAY_SECONDS))
+    while True:
+        try:
+            if await acquire_maintenance_lease(interval * 0.8):
+                await run_maintenance()
+        except Exception as e:
+            logging.error(f"Maintenance error: {e}")
+        await asyncio.sleep(interval)
+
 # ============= HEALTH CHECK =============
 
 @api_router.get("/")
@@ -514,14 +1468,14 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Request-ID", "Retry-After", "RateLimit-Limit", "RateLimit-Remaining", "RateLimit-Reset"],
 )
 
+app.add_middleware(TracingMiddleware)
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
@@ -64,6 +64,8 @@ class MarketPulseAPITester:
                 response = requests.get(url, headers=headers, timeout=30)
             elif method == 'POST':
                 response = requests.post(url, json=data, headers=headers, timeout=30)
+            elif method == 'PATCH':
+                response = requests.patch(url, json=data, headers=headers, timeout=30)
             elif method == 'DELETE':
                 response = requests.delete(url, headers=headers, timeout=30)
             else:
@@ -179,6 +181,32 @@ class MarketPulseAPITester:
         self.log_test("Get single analysis", success, details, data)
         return success
 
+    def test_similar_analyses(self):
+        """Test near-duplicate lookup for an analysis"""
+        if not hasattr(self, 'analysis_id'):
+            self.log_test("Get similar analyses", False, "No analysis ID available")
+            return False
+            
+        print("\n🔍 Testing Similar Analyses...")
+        
+        success, details, data = self.make_request('GET', f'analyses/{self.analysis_id}/similar?threshold=0')
+        self.log_test("Get similar analyses", success and isinstance(data, list), details, data)
+        return success
+
+    def test_update_analysis(self):
+        """Test partial analysis update"""
+        if not hasattr(self, 'analysis_id'):
+            self.log_test("Update analysis", False, "No analysis ID available")
+            return False
+            
+        print("\n🔍 Testing Analysis Update...")
+        
+        update_data = {"competitors": ["Competitor1", "Competitor2", "Competitor3"]}
+        success, details, data = self.make_request('PATCH', f'analyses/{self.analysis_id}', update_data)
+        success = success and data.get('version') == 2 and data.get('competitors') == update_data['competitors']
+        self.log_test("Update analysis", success, details, data)
+        return success
+
     def test_get_opportunities(self):
         """Test getting opportunities"""
         print("\n🔍 Testing Get Opportunities...")
@@ -208,6 +236,27 @@ class MarketPulseAPITester:
             return True
         return False
 
+    def test_create_report_bundle(self):
+        """Test generating all report types in one request"""
+        if not hasattr(self, 'analysis_id'):
+            self.log_test("Create report bundle", False, "No analysis ID available")
+            return False
+            
+        print("\n🔍 Testing Report Bundle Creation...")
+        
+        # market_overview already exists; new accounts are on the starter rate
+        # limit (5 tokens), which this flow must fit: create 1, report 1,
+        # bundle 2, update 1
+        bundle_data = {
+            "analysis_id": self.analysis_id,
+            "report_types": ["competitor_analysis", "opportunity_report"]
+        }
+        
+        success, details, data = self.make_request('POST', 'reports/bundle', bundle_data)
+        success = success and isinstance(data, list) and len(data) == 2
+        self.log_test("Create report bundle", success, details, data)
+        return success
+
     def test_get_reports(self):
         """Test getting reports"""
         print("\n🔍 Testing Get Reports...")
@@ -238,6 +287,12 @@ class MarketPulseAPITester:
         
         success, details, data = self.make_request('DELETE', f'analyses/{self.analysis_id}')
         self.log_test("Delete analysis", success, details, data)
+        
+        # Reports were created for this analysis, so the delete must cascade to them
+        if hasattr(self, 'report_id'):
+            cascaded = success and data.get('deleted_reports', 0) >= 1
+            self.log_test("Delete cascades to reports", cascaded, details, data)
+            success = cascaded
         return success
 
     def run_all_tests(self):
@@ -264,12 +319,15 @@ class MarketPulseAPITester:
         if self.test_create_analysis():
             self.test_get_analyses()
             self.test_get_single_analysis()
+            self.test_similar_analyses()
             self.test_get_opportunities()
             
             # Report workflow
             if self.test_create_report():
+                self.test_create_report_bundle()
                 self.test_get_reports()
                 self.test_get_single_report()
+                self.test_update_analysis()
             
             # Cleanup
             self.test_delete_analysis()
@@ -0,0 +1,243 @@
+"""
+Unit tests for the in-memory token buckets and the LLM admission gate
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi import HTTPException
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import server
+from server import LlmAdmission, MemoryRateLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(server.time, "monotonic", fake)
+    return fake
+
+
+# ============= MEMORY RATE LIMITER =============
+
+def test_bucket_allows_burst_up_to_capacity(clock):
+    limiter = MemoryRateLimiter()
+
+    results = [asyncio.run(limiter.take("user", 3, 1.0, 1)) for _ in range(4)]
+
+    assert [allowed for allowed, _ in results] == [True, True, True, False]
+    assert results[2][1] == 0
+
+
+def test_bucket_refills_over_time_without_exceeding_capacity(clock):
+    limiter = MemoryRateLimiter()
+    for _ in range(3):
+        asyncio.run(limiter.take("user", 3, 0.5, 1))
+
+    clock.now += 2
+    allowed, tokens = asyncio.run(limiter.take("user", 3, 0.5, 1))
+    assert allowed and tokens == 0
+
+    clock.now += 3600
+    allowed, tokens = asyncio.run(limiter.take("user", 3, 0.5, 1))
+    assert allowed and tokens == 2
+
+
+def test_rejected_request_does_not_drain_bucket(clock):
+    limiter = MemoryRateLimiter()
+    asyncio.run(limiter.take("user", 3, 1.0, 2))
+
+    allowed, tokens = asyncio.run(limiter.take("user", 3, 1.0, 2))
+
+    assert not allowed
+    assert tokens == 1
+
+
+def test_buckets_are_per_key(clock):
+    limiter = MemoryRateLimiter()
+    asyncio.run(limiter.take("a", 1, 1.0, 1))
+
+    assert asyncio.run(limiter.take("a", 1, 1.0, 1))[0] is False
+    assert asyncio.run(limiter.take("b", 1, 1.0, 1))[0] is True
+
+
+def test_refund_is_capped_at_capacity(clock):
+    limiter = MemoryRateLimiter()
+    asyncio.run(limiter.take("user", 3, 1.0, 2))
+
+    asyncio.run(limiter.refund("user", 3, 5))
+    assert limiter.buckets["user"][0] == 3
+
+    asyncio.run(limiter.refund("unknown", 3, 1))
+    assert "unknown" not in limiter.buckets
+
+
+# ============= LLM ADMISSION =============
+
+async def hold(admission, priority, started, release, order=None, name=None):
+    async with admission.slot(priority):
+        if order is not None:
+            order.append(name)
+        started.set()
+        await release.wait()
+
+
+def test_admits_immediately_below_limit():
+    async def scenario():
+        admission = LlmAdmission(2)
+        async with admission.slot(0):
+            async with admission.slot(0):
+                assert admission.active == 2
+        assert admission.active == 0
+        assert admission.waiters == []
+
+    asyncio.run(scenario())
+
+
+def test_released_slot_is_handed_to_waiter():
+    async def scenario():
+        admission = LlmAdmission(1)
+        release = asyncio.Event()
+        holder = asyncio.create_task(hold(admission, 0, asyncio.Event(), release))
+        await asyncio.sleep(0)
+
+        waiter_started = asyncio.Event()
+        waiter_release = asyncio.Event()
+        waiter = asyncio.create_task(hold(admission, 0, waiter_started, waiter_release))
+        await asyncio.sleep(0)
+        assert len(admission.waiters) == 1
+
+        release.set()
+        await holder
+        await waiter_started.wait()
+        # The slot moved over without being freed in between
+        assert admission.active == 1
+
+        waiter_release.set()
+        await waiter
+        assert admission.active == 0
+
+    asyncio.run(scenario())
+
+
+def test_waiters_are_admitted_by_priority_then_fifo():
+    async def scenario():
+        admission = LlmAdmission(1)
+        order = []
+        release = asyncio.Event()
+        release.set()
+        gate = asyncio.Event()
+        first = asyncio.create_task(hold(admission, 0, asyncio.Event(), gate, order, "first"))
+        await asyncio.sleep(0)
+
+        waiters = []
+        for name, priority in [("low", 0), ("high", 2), ("mid", 1), ("high-later", 2)]:
+            waiters.append(asyncio.create_task(hold(admission, priority, asyncio.Event(), release, order, name)))
+            await asyncio.sleep(0)
+
+        gate.set()
+        await asyncio.gather(first, *waiters)
+        assert order == ["first", "high", "high-later", "mid", "low"]
+        assert admission.active == 0
+
+    asyncio.run(scenario())
+
+
+def test_newcomer_queues_behind_existing_waiters():
+    async def scenario():
+        admission = LlmAdmission(1)
+        # A free slot is still queued for while someone is already waiting for it
+        admission.waiters.append((0, -1, asyncio.get_running_loop().create_future()))
+
+        newcomer = asyncio.create_task(admission._acquire(5))
+        await asyncio.sleep(0)
+        assert not newcomer.done()
+        assert admission.active == 0
+        assert len(admission.waiters) == 2
+        newcomer.cancel()
+        await asyncio.gather(newcomer, return_exceptions=True)
+
+    asyncio.run(scenario())
+
+
+def test_timeout_raises_503_and_leaves_no_slot_behind(monkeypatch):
+    monkeypatch.setattr(server, "LLM_ADMISSION_TIMEOUT", 0.01)
+
+    async def scenario():
+        admission = LlmAdmission(1)
+        release = asyncio.Event()
+        holder = asyncio.create_task(hold(admission, 0, asyncio.Event(), release))
+        await asyncio.sleep(0)
+
+        with pytest.raises(HTTPException) as error:
+            async with admission.slot(2):
+                pass
+        assert error.value.status_code == 503
+        assert error.value.headers["Retry-After"] == "1"
+
+        release.set()
+        await holder
+        assert admission.active == 0
+        assert admission.waiters == []
+
+        async with admission.slot(0):
+            assert admission.active == 1
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_is_skipped():
+    async def scenario():
+        admission = LlmAdmission(1)
+        release = asyncio.Event()
+        holder = asyncio.create_task(hold(admission, 0, asyncio.Event(), release))
+        await asyncio.sleep(0)
+
+        waiter = asyncio.create_task(hold(admission, 0, asyncio.Event(), asyncio.Event()))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+        release.set()
+        await holder
+        assert admission.active == 0
+        assert admission.waiters == []
+
+    asyncio.run(scenario())
+
+
+def test_slot_handed_to_cancelled_waiter_is_released():
+    async def scenario():
+        admission = LlmAdmission(1)
+        release = asyncio.Event()
+        holder = asyncio.create_task(hold(admission, 0, asyncio.Event(), release))
+        await asyncio.sleep(0)
+
+        waiter_release = asyncio.Event()
+        waiter_release.set()
+        waiter = asyncio.create_task(hold(admission, 0, asyncio.Event(), waiter_release))
+        await asyncio.sleep(0)
+
+        # Hand the slot over, then cancel the waiter before it gets to run
+        release.set()
+        await holder
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+
+        assert admission.active == 0
+        assert admission.waiters == []
+
+    asyncio.run(scenario())